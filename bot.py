@@ -1,7 +1,14 @@
 import logging
 import asyncio
+import bisect
 import os
+import re
+import signal
+import time
 import database
+from persistence import RedisPersistence
+from dataclasses import dataclass, asdict, replace
+from typing import Optional
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
@@ -17,8 +24,11 @@ load_dotenv()
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
+    level=os.getenv("LOG_LEVEL", "INFO").upper()
 )
+# httpx and PTB log a line per request/update at INFO; keep them to warnings.
+for noisy in ("httpx", "telegram.ext.Application", "telegram.ext.Updater", "telegram.Bot"):
+    logging.getLogger(noisy).setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 GENDER, AGE, WEIGHT, HEIGHT, ACTIVITY, GOAL = range(6)
@@ -53,20 +63,43 @@ GOALS = {
     "💥 Bulk (aggressive)": +500,
 }
 
-STEP_ORDER = [GENDER, AGE, WEIGHT, HEIGHT, ACTIVITY, GOAL]
-STEP_NAMES = {
-    GENDER:   "gender",
-    AGE:      "age",
-    WEIGHT:   "weight",
-    HEIGHT:   "height",
-    ACTIVITY: "activity",
-    GOAL:     "goal",
-}
+# Handlers check NAV_BUTTONS first, so ordinary answers skip both comparisons.
+RESTART = "🔄 Restart"
+BACK    = "⬅️ Back"
+NAV_BUTTONS = frozenset((RESTART, BACK))
+
+# Shape checks for the numeric steps; ranges are still validated in the handlers.
+AGE_RE    = re.compile(r"\d{2,3}", re.ASCII)
+WEIGHT_RE = re.compile(r"\d{2,3}(?:[.,]\d*)?", re.ASCII)
+HEIGHT_RE = re.compile(r"\d{3}(?:[.,]\d*)?", re.ASCII)
+
+# Steps are the dense range 0..5, so per-step tables are tuples indexed by step.
+STEP_ORDER = range(GENDER, GOAL + 1)
+STEP_NAMES = ("gender", "age", "weight", "height", "activity", "goal")
+
+
+@dataclass(slots=True)
+class UserState:
+    """Answers collected so far in one user's conversation."""
+    gender:       Optional[str]   = None
+    age:          Optional[int]   = None
+    weight:       Optional[float] = None
+    height:       Optional[float] = None
+    activity:     Optional[str]   = None
+    goal:         Optional[str]   = None
+    current_step: int             = GENDER
+
+
+def get_state(context: ContextTypes.DEFAULT_TYPE) -> UserState:
+    state = context.user_data.get("state")
+    if state is None:
+        state = context.user_data["state"] = UserState()
+    return state
 
 
 def nav_keyboard(keys: list) -> ReplyKeyboardMarkup:
     """Builds a keyboard with nav buttons appended at the bottom."""
-    nav_row = ["🔄 Restart", "⬅️ Back"]
+    nav_row = [RESTART, BACK]
     return ReplyKeyboardMarkup(
         keys + [nav_row],
         one_time_keyboard=True,
@@ -77,27 +110,45 @@ def nav_keyboard(keys: list) -> ReplyKeyboardMarkup:
 def nav_keyboard_text() -> ReplyKeyboardMarkup:
     """Nav-only keyboard for text-input steps (age, weight, height)."""
     return ReplyKeyboardMarkup(
-        [["🔄 Restart", "⬅️ Back"]],
+        [[RESTART, BACK]],
         one_time_keyboard=False,
         resize_keyboard=True
     )
 
 
+ACTIVITY_DESCRIPTIONS = "\n".join(
+    f"{key} — {val['description']}"
+    for key, val in ACTIVITY_LEVELS.items()
+)
+# Static keyboards, built once and shared (ReplyKeyboardMarkup is immutable).
+GENDER_KEYBOARD   = nav_keyboard([["👨 Male", "👩 Female"]])
+NAV_ONLY_KEYBOARD = nav_keyboard_text()
+ACTIVITY_KEYBOARD = nav_keyboard([[level] for level in ACTIVITY_LEVELS])
+GOAL_KEYBOARD     = nav_keyboard([[goal] for goal in GOALS])
+FINAL_KEYBOARD    = ReplyKeyboardMarkup([[RESTART]], resize_keyboard=True)
+
+
 def is_restart(text: str) -> bool:
-    return text == "🔄 Restart"
+    return text == RESTART
 
 
 def is_back(text: str) -> bool:
-    return text == "⬅️ Back"
+    return text == BACK
+
+
+def _bmr_male(age: int, weight: float, height: float) -> float:
+    return (10 * weight) + (6.25 * height) - (5 * age) + 5
+
+
+def _bmr_female(age: int, weight: float, height: float) -> float:
+    return (10 * weight) + (6.25 * height) - (5 * age) - 161
+
+
+_BMR_FUNCS = {"male": _bmr_male, "female": _bmr_female}
 
 
 def calculate_bmr(gender: str, age: int, weight: float, height: float) -> float:
-    bmr = (10 * weight) + (6.25 * height) - (5 * age)
-    if gender == "male":
-        bmr += 5
-    else:
-        bmr -= 161
-    return bmr
+    return _BMR_FUNCS[gender](age, weight, height)
 
 
 def calculate_tdee(bmr: float, activity_key: str) -> float:
@@ -105,84 +156,102 @@ def calculate_tdee(bmr: float, activity_key: str) -> float:
     return bmr * multiplier
 
 
+# Calorie share divided by kcal per gram: protein 30% / 4, fat 25% / 9, carbs 45% / 4.
+PROTEIN_PER_KCAL = 0.30 / 4
+FAT_PER_KCAL     = 0.25 / 9
+CARBS_PER_KCAL   = 0.45 / 4
+
+# Extra water (ml) by activity multiplier: below 1.375, from 1.375, 1.55, 1.725.
+WATER_THRESHOLDS = (1.375, 1.55, 1.725)
+WATER_EXTRA_ML   = (0, 200, 400, 700)
+
+
 def calculate_macros(calories: float, goal_key: str) -> dict:
-    protein_cals = calories * 0.30
-    fat_cals     = calories * 0.25
-    carb_cals    = calories * 0.45
     return {
-        "protein": round(protein_cals / 4),
-        "fat":     round(fat_cals / 9),
-        "carbs":   round(carb_cals / 4),
+        "protein": round(calories * PROTEIN_PER_KCAL),
+        "fat":     round(calories * FAT_PER_KCAL),
+        "carbs":   round(calories * CARBS_PER_KCAL),
     }
 
 
 def calculate_water(weight: float, activity_key: str) -> float:
-    base = weight * 35
     multiplier = ACTIVITY_LEVELS[activity_key]["multiplier"]
-    if multiplier >= 1.725:
-        base += 700
-    elif multiplier >= 1.55:
-        base += 400
-    elif multiplier >= 1.375:
-        base += 200
-    return round(base / 1000, 1)
-
-
-def format_result(user_data: dict) -> str:
-    gender       = user_data["gender"]
-    age          = user_data["age"]
-    weight       = user_data["weight"]
-    height       = user_data["height"]
-    activity_key = user_data["activity"]
-    goal_key     = user_data["goal"]
+    extra = WATER_EXTRA_ML[bisect.bisect_right(WATER_THRESHOLDS, multiplier)]
+    return round((weight * 35 + extra) / 1000, 1)
 
-    bmr           = calculate_bmr(gender, age, weight, height)
-    tdee          = calculate_tdee(bmr, activity_key)
-    goal_calories = tdee + GOALS[goal_key]
-    macros        = calculate_macros(goal_calories, goal_key)
-    water         = calculate_water(weight, activity_key)
-    gender_icon   = "👨" if gender == "male" else "👩"
 
-    result = f"""
+RESULT_TEMPLATE = """
 🏋️ *Your results, {gender_icon}*
 
 📊 *Your stats:*
 ├ Age: {age} years
 ├ Weight: {weight} kg
 ├ Height: {height} cm
-├ Activity: {activity_key}
-└ Goal: {goal_key}
+├ Activity: {activity}
+└ Goal: {goal}
 
 🔥 *Calories:*
-├ Basal Metabolic Rate (BMR): *{round(bmr)} kcal/day*
-├ With activity (TDEE): *{round(tdee)} kcal/day*
-└ Your target: *{round(goal_calories)} kcal/day* ⬅️
+├ Basal Metabolic Rate (BMR): *{bmr} kcal/day*
+├ With activity (TDEE): *{tdee} kcal/day*
+└ Your target: *{goal_calories} kcal/day* ⬅️
 
 🥩 *Daily macros:*
-├ 🥚 Protein: *{macros["protein"]} g* ({round(macros["protein"] * 4)} kcal)
-├ 🥑 Fat: *{macros["fat"]} g* ({round(macros["fat"] * 9)} kcal)
-└ 🍚 Carbs: *{macros["carbs"]} g* ({round(macros["carbs"] * 4)} kcal)
+├ 🥚 Protein: *{protein} g* ({protein_kcal} kcal)
+├ 🥑 Fat: *{fat} g* ({fat_kcal} kcal)
+└ 🍚 Carbs: *{carbs} g* ({carbs_kcal} kcal)
 
 💧 *Daily water intake: {water} L*
 
 💡 *What this means:*
-"""
+{explanation}
 
-    if goal_key == "⬇️ Lose weight":
-        result += "A 500 kcal deficit means roughly *-0.5 kg per week* — safe and steady."
-    elif goal_key == "⚖️ Maintain weight":
-        result += "Eat this amount and your weight stays stable. Perfect for body recomposition."
-    elif goal_key == "⬆️ Gain muscle":
-        result += "A 300 kcal surplus means slow, clean muscle gain with minimal fat."
-    elif goal_key == "💥 Bulk (aggressive)":
-        result += "A 500 kcal surplus means fast mass gain — great for hardgainers."
+📌 Press /start or 🔄 Restart to recalculate."""
+
+GOAL_EXPLANATIONS = {
+    "⬇️ Lose weight":       "A 500 kcal deficit means roughly *-0.5 kg per week* — safe and steady.",
+    "⚖️ Maintain weight":   "Eat this amount and your weight stays stable. Perfect for body recomposition.",
+    "⬆️ Gain muscle":       "A 300 kcal surplus means slow, clean muscle gain with minimal fat.",
+    "💥 Bulk (aggressive)": "A 500 kcal surplus means fast mass gain — great for hardgainers.",
+}
 
-    result += "\n\n📌 Press /start or 🔄 Restart to recalculate."
-    return result
+
+def format_result(state: UserState) -> str:
+    gender       = state.gender
+    age          = state.age
+    weight       = state.weight
+    height       = state.height
+    activity_key = state.activity
+    goal_key     = state.goal
+
+    bmr           = calculate_bmr(gender, age, weight, height)
+    tdee          = calculate_tdee(bmr, activity_key)
+    goal_calories = tdee + GOALS[goal_key]
+    macros        = calculate_macros(goal_calories, goal_key)
+    water         = calculate_water(weight, activity_key)
+    gender_icon   = "👨" if gender == "male" else "👩"
+
+    return RESULT_TEMPLATE.format(
+        gender_icon=gender_icon,
+        age=age,
+        weight=weight,
+        height=height,
+        activity=activity_key,
+        goal=goal_key,
+        bmr=round(bmr),
+        tdee=round(tdee),
+        goal_calories=round(goal_calories),
+        protein=macros["protein"],
+        protein_kcal=round(macros["protein"] * 4),
+        fat=macros["fat"],
+        fat_kcal=round(macros["fat"] * 9),
+        carbs=macros["carbs"],
+        carbs_kcal=round(macros["carbs"] * 4),
+        water=water,
+        explanation=GOAL_EXPLANATIONS[goal_key],
+    )
 
 
 async def ask_gender(update: Update) -> int:
-    keyboard = nav_keyboard([["👨 Male", "👩 Female"]])
     await update.message.reply_text(
         "👋 Hey! I'm *FitCalc* — your personal calorie calculator.\n\n"
         "In 30 seconds I'll calculate:\n"
@@ -191,7 +260,7 @@ async def ask_gender(update: Update) -> int:
         "✅ Daily water intake\n\n"
         "Let's go! *Select your gender:*",
         parse_mode="Markdown",
-        reply_markup=keyboard
+        reply_markup=GENDER_KEYBOARD
     )
     return GENDER
 
@@ -201,7 +270,7 @@ async def ask_age(update: Update) -> int:
         "💪 Great! Now *how old are you?*\n\n"
         "_(just type a number, e.g. 22)_",
         parse_mode="Markdown",
-        reply_markup=nav_keyboard_text()
+        reply_markup=NAV_ONLY_KEYBOARD
     )
     return AGE
 
@@ -211,7 +280,7 @@ async def ask_weight(update: Update) -> int:
         "⚖️ Got it! Now *your weight in kg?*\n\n"
         "_(decimals are fine: 75.5)_",
         parse_mode="Markdown",
-        reply_markup=nav_keyboard_text()
+        reply_markup=NAV_ONLY_KEYBOARD
     )
     return WEIGHT
 
@@ -221,211 +290,192 @@ async def ask_height(update: Update) -> int:
         "📏 Almost there! *Your height in cm?*\n\n"
         "_(e.g. 180)_",
         parse_mode="Markdown",
-        reply_markup=nav_keyboard_text()
+        reply_markup=NAV_ONLY_KEYBOARD
     )
     return HEIGHT
 
 
 async def ask_activity(update: Update) -> int:
-    descriptions = "\n".join([
-        f"{key} — {val['description']}"
-        for key, val in ACTIVITY_LEVELS.items()
-    ])
-    keyboard = nav_keyboard([[level] for level in ACTIVITY_LEVELS.keys()])
     await update.message.reply_text(
-        f"🏃 *Choose your activity level:*\n\n{descriptions}",
+        f"🏃 *Choose your activity level:*\n\n{ACTIVITY_DESCRIPTIONS}",
         parse_mode="Markdown",
-        reply_markup=keyboard
+        reply_markup=ACTIVITY_KEYBOARD
     )
     return ACTIVITY
 
 
 async def ask_goal(update: Update) -> int:
-    keyboard = nav_keyboard([[goal] for goal in GOALS.keys()])
     await update.message.reply_text(
         "🎯 *Last question — what's your goal?*",
         parse_mode="Markdown",
-        reply_markup=keyboard
+        reply_markup=GOAL_KEYBOARD
     )
     return GOAL
 
 
-ASK_STEP = {
-    GENDER:   ask_gender,
-    AGE:      ask_age,
-    WEIGHT:   ask_weight,
-    HEIGHT:   ask_height,
-    ACTIVITY: ask_activity,
-    GOAL:     ask_goal,
-}
+ASK_STEP = (ask_gender, ask_age, ask_weight, ask_height, ask_activity, ask_goal)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data.clear()
     user = update.effective_user
-    database.add_or_update_user(user.id, user.username, user.first_name)
-    context.user_data["current_step"] = GENDER
+    await database.add_or_update_user(user.id, user.username, user.first_name)
+    context.user_data["state"] = UserState()
     return await ask_gender(update)
 
 
 async def back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    current = context.user_data.get("current_step", GENDER)
-    prev = current - 1
+    state = get_state(context)
+    prev = state.current_step - 1
 
     if prev < GENDER:
         await update.message.reply_text("⚠️ You're already at the first step!")
         return await ask_gender(update)
 
-    field = STEP_NAMES.get(prev)
-    if field and field in context.user_data:
-        del context.user_data[field]
+    setattr(state, STEP_NAMES[prev], None)
 
-    context.user_data["current_step"] = prev
+    state.current_step = prev
     return await ASK_STEP[prev](update)
 
 
 async def gender_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if is_restart(text):
-        return await start(update, context)
-    if is_back(text):
+    if text in NAV_BUTTONS:
+        if is_restart(text):
+            return await start(update, context)
         return await back(update, context)
 
-    context.user_data["gender"] = "male" if "Male" in text else "female"
-    context.user_data["current_step"] = AGE
+    state = get_state(context)
+    state.gender = "male" if "Male" in text else "female"
+    state.current_step = AGE
     return await ask_age(update)
 
 
 async def age_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if is_restart(text):
-        return await start(update, context)
-    if is_back(text):
+    if text in NAV_BUTTONS:
+        if is_restart(text):
+            return await start(update, context)
         return await back(update, context)
 
-    try:
-        age = int(text)
-        if age < 10 or age > 100:
-            raise ValueError
-    except ValueError:
+    value = text.strip()
+    age = int(value) if AGE_RE.fullmatch(value) else None
+    if age is None or age < 10 or age > 100:
         await update.message.reply_text(
             "⚠️ Please enter an age between 10 and 100, e.g. *22*",
             parse_mode="Markdown",
-            reply_markup=nav_keyboard_text()
+            reply_markup=NAV_ONLY_KEYBOARD
         )
         return AGE
 
-    context.user_data["age"] = age
-    context.user_data["current_step"] = WEIGHT
+    state = get_state(context)
+    state.age = age
+    state.current_step = WEIGHT
     return await ask_weight(update)
 
 
 async def weight_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if is_restart(text):
-        return await start(update, context)
-    if is_back(text):
+    if text in NAV_BUTTONS:
+        if is_restart(text):
+            return await start(update, context)
         return await back(update, context)
 
-    try:
-        weight = float(text.replace(",", "."))
-        if weight < 30 or weight > 300:
-            raise ValueError
-    except ValueError:
+    value = text.strip()
+    weight = float(value.replace(",", ".")) if WEIGHT_RE.fullmatch(value) else None
+    if weight is None or weight < 30 or weight > 300:
         await update.message.reply_text(
             "⚠️ Please enter a weight between 30 and 300, e.g. *75.5*",
             parse_mode="Markdown",
-            reply_markup=nav_keyboard_text()
+            reply_markup=NAV_ONLY_KEYBOARD
         )
         return WEIGHT
 
-    context.user_data["weight"] = weight
-    context.user_data["current_step"] = HEIGHT
+    state = get_state(context)
+    state.weight = weight
+    state.current_step = HEIGHT
     return await ask_height(update)
 
 
 async def height_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if is_restart(text):
-        return await start(update, context)
-    if is_back(text):
+    if text in NAV_BUTTONS:
+        if is_restart(text):
+            return await start(update, context)
         return await back(update, context)
 
-    try:
-        height = float(text.replace(",", "."))
-        if height < 100 or height > 250:
-            raise ValueError
-    except ValueError:
+    value = text.strip()
+    height = float(value.replace(",", ".")) if HEIGHT_RE.fullmatch(value) else None
+    if height is None or height < 100 or height > 250:
         await update.message.reply_text(
             "⚠️ Please enter a height between 100 and 250, e.g. *180*",
             parse_mode="Markdown",
-            reply_markup=nav_keyboard_text()
+            reply_markup=NAV_ONLY_KEYBOARD
         )
         return HEIGHT
 
-    context.user_data["height"] = height
-    context.user_data["current_step"] = ACTIVITY
+    state = get_state(context)
+    state.height = height
+    state.current_step = ACTIVITY
     return await ask_activity(update)
 
 
 async def activity_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if is_restart(text):
-        return await start(update, context)
-    if is_back(text):
+    if text in NAV_BUTTONS:
+        if is_restart(text):
+            return await start(update, context)
         return await back(update, context)
 
     if text not in ACTIVITY_LEVELS:
         await update.message.reply_text(
             "⚠️ Please choose one of the options on the keyboard below.",
-            reply_markup=nav_keyboard([[level] for level in ACTIVITY_LEVELS.keys()])
+            reply_markup=ACTIVITY_KEYBOARD
         )
         return ACTIVITY
 
-    context.user_data["activity"] = text
-    context.user_data["current_step"] = GOAL
+    state = get_state(context)
+    state.activity = text
+    state.current_step = GOAL
     return await ask_goal(update)
 
 
 async def goal_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if is_restart(text):
-        return await start(update, context)
-    if is_back(text):
+    if text in NAV_BUTTONS:
+        if is_restart(text):
+            return await start(update, context)
         return await back(update, context)
 
     if text not in GOALS:
         await update.message.reply_text(
             "⚠️ Please choose one of the options on the keyboard below.",
-            reply_markup=nav_keyboard([[goal] for goal in GOALS.keys()])
+            reply_markup=GOAL_KEYBOARD
         )
         return GOAL
 
-    context.user_data["goal"] = text
+    state = get_state(context)
+    state.goal = text
 
-    user_data = context.user_data
-    bmr = calculate_bmr(user_data["gender"], user_data["age"], 
-                       user_data["weight"], user_data["height"])
-    tdee = calculate_tdee(bmr, user_data["activity"])
-    target_calories = tdee + GOALS[user_data["goal"]]
+    bmr = calculate_bmr(state.gender, state.age, state.weight, state.height)
+    tdee = calculate_tdee(bmr, state.activity)
+    target_calories = tdee + GOALS[state.goal]
     
     # Save to DB
-    database.save_calculation(
+    await database.save_calculation(
         update.effective_user.id,
         {
-            **user_data,
+            **asdict(state),
             'bmr': bmr,
             'tdee': tdee,
             'target_calories': target_calories
         }
     )
-    result = format_result(context.user_data)
+    # Format on a worker thread from a snapshot, so later edits can't race it.
+    result = await asyncio.to_thread(format_result, replace(state))
     await update.message.reply_text(
         result,
         parse_mode="Markdown",
-        reply_markup=ReplyKeyboardMarkup(
-            [["🔄 Restart"]],
-            resize_keyboard=True
-        )
+        reply_markup=FINAL_KEYBOARD
     )
     return ConversationHandler.END
 
@@ -457,10 +507,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown"
     )
 
-async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# /stats is an aggregate view, so a rendered message is reused for STATS_TTL seconds.
+STATS_TTL = 30
+_stats_cache = (0.0, None)
+_stats_lock = asyncio.Lock()
 
-    stats = database.get_user_stats()
-    
+
+def format_stats(stats: dict) -> str:
     top_goals_text = "\n".join([
         f"  • {goal}: {count} users"
         for goal, count in stats['top_goals'][:3]
@@ -471,7 +524,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for activity, count in stats['top_activities'][:3]
     ]) if stats['top_activities'] else "  No data yet"
     
-    message = f"""
+    return f"""
 📊 *FitCalc Statistics*
 
 👥 *Users:* {stats['total_users']} registered
@@ -488,7 +541,23 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🏃 *Activity levels:*
 {top_activities_text}
 """
-    
+
+
+async def get_stats_message() -> str:
+    global _stats_cache
+    # The lock lets a burst of /stats calls share a single DB read.
+    async with _stats_lock:
+        cached_at, message = _stats_cache
+        now = time.monotonic()
+        if message is None or now - cached_at >= STATS_TTL:
+            stats = await asyncio.to_thread(database.get_user_stats)
+            message = format_stats(stats)
+            _stats_cache = (now, message)
+    return message
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = await get_stats_message()
     await update.message.reply_text(message, parse_mode="Markdown")
 
 
@@ -503,17 +572,21 @@ async def main():
         return
 
     database.init_db()
+    database.start_writer()
 
-
-
-    app = Application.builder().token(token).build()
+    builder = Application.builder().token(token)
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        # Keep in-progress conversations across restarts (single process only).
+        builder = builder.persistence(RedisPersistence(redis_url, UserState))
+    app = builder.build()
 
     nav_filter = filters.TEXT & ~filters.COMMAND
 
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("start", start),
-            MessageHandler(filters.Text(["🔄 Restart"]), start),
+            MessageHandler(filters.Text([RESTART]), start),
         ],
         states={
             GENDER:   [MessageHandler(nav_filter, gender_handler)],
@@ -528,6 +601,8 @@ async def main():
             CommandHandler("start", start),
             CommandHandler("back", back),
         ],
+        name="fitcalc",
+        persistent=bool(redis_url),
     )
 
     app.add_handler(conv_handler)
@@ -540,20 +615,43 @@ async def main():
 
     await app.initialize()
     await app.start()
-    await app.updater.start_polling()
+    public_url = os.getenv("PUBLIC_URL")
+    if public_url:
+        # Telegram pushes updates to us; expects a reverse proxy terminating TLS.
+        await app.updater.start_webhook(
+            listen="0.0.0.0",
+            port=int(os.getenv("PORT", 8443)),
+            url_path=token,
+            webhook_url=f"{public_url.rstrip('/')}/{token}"
+        )
+    else:
+        await app.updater.start_polling()
 
     print("Bot is live! Press Ctrl+C to stop.")
 
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C cancels the task via asyncio.run instead
+
     try:
-        while True:
-            await asyncio.sleep(1)
-    except (KeyboardInterrupt, SystemExit):
+        await stop.wait()
         print("Shutting down...")
     finally:
         await app.updater.stop()
         await app.stop()
         await app.shutdown()
+        await database.stop_writer()
+        database.close_db()
         print("Bot stopped.")
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file
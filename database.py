@@ -3,78 +3,205 @@ Database module for FitCalc bot
 Handles user storage and calculation history
 """
 
+import asyncio
+import json
+import logging
 import sqlite3
+import threading
 from datetime import datetime
 from typing import Optional, Dict, List
 import os
+from pathlib import Path
 
 DB_PATH = os.getenv("DB_PATH", "fitcalc.db")
 
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+# Shared connections, opened once in init_db() and reused by every helper.
+# Writes go through _CONN; stats/history reads use the read-only _RO_CONN,
+# which under WAL never blocks (or waits on) the writer.
+_CONN: Optional[sqlite3.Connection] = None
+_LOCK = threading.Lock()
+_RO_CONN: Optional[sqlite3.Connection] = None
+_RO_LOCK = threading.Lock()
+
+# Write-behind queue: handlers enqueue rows, a single background task commits
+# them in batches so the event loop never waits on an fsync.
+WRITE_BATCH_SIZE = 64
+_write_queue: asyncio.Queue = asyncio.Queue()
+_writer_task: Optional[asyncio.Task] = None
+
+CALC_INDEXES = {"idx_calc_user_created", "idx_calc_goal", "idx_calc_activity"}
+
+logger = logging.getLogger(__name__)
+
+
+def _connect(database: str, **kwargs) -> sqlite3.Connection:
+    """Open an autocommit connection with the tuning PRAGMAs applied."""
+    conn = sqlite3.connect(
+        database,
+        check_same_thread=False,
+        isolation_level=None,
+        **kwargs
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 
 def init_db():
     """Initialize database with required tables."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS calculations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            gender TEXT NOT NULL,
-            age INTEGER NOT NULL,
-            weight REAL NOT NULL,
-            height REAL NOT NULL,
-            activity TEXT NOT NULL,
-            goal TEXT NOT NULL,
-            bmr REAL NOT NULL,
-            tdee REAL NOT NULL,
-            target_calories REAL NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
-
-
-def add_or_update_user(user_id: int, username: Optional[str], first_name: Optional[str]):
+    global _CONN
+    if _CONN is None:
+        _CONN = _connect(DB_PATH)
+
+    with _LOCK:
+        _CONN.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        _CONN.execute("""
+            CREATE TABLE IF NOT EXISTS calculations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                gender TEXT NOT NULL,
+                age INTEGER NOT NULL,
+                weight REAL NOT NULL,
+                height REAL NOT NULL,
+                activity TEXT NOT NULL,
+                goal TEXT NOT NULL,
+                bmr REAL NOT NULL,
+                tdee REAL NOT NULL,
+                target_calories REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """)
+
+        existing = {name for (name,) in _CONN.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        )}
+
+        _CONN.execute("""
+            CREATE INDEX IF NOT EXISTS idx_calc_user_created
+            ON calculations(user_id, created_at DESC)
+        """)
+        _CONN.execute("CREATE INDEX IF NOT EXISTS idx_calc_goal ON calculations(goal)")
+        _CONN.execute("CREATE INDEX IF NOT EXISTS idx_calc_activity ON calculations(activity)")
+
+        # Gather planner statistics once, when the indexes are first created.
+        if not CALC_INDEXES <= existing:
+            _CONN.execute("ANALYZE")
+
+    global _RO_CONN
+    if _RO_CONN is None:
+        _RO_CONN = _connect(f"{Path(DB_PATH).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def close_db():
+    """Close the shared connections."""
+    global _CONN, _RO_CONN
+    with _RO_LOCK:
+        if _RO_CONN is not None:
+            _RO_CONN.close()
+            _RO_CONN = None
+    with _LOCK:
+        if _CONN is not None:
+            _CONN.close()
+            _CONN = None
+
+
+def _write_batch(batch: List[tuple]):
+    """Write a batch of queued rows in a single transaction."""
+    users = [values for kind, values in batch if kind == "user"]
+    calcs = [values for kind, values in batch if kind == "calc"]
+
+    with _LOCK:
+        _CONN.execute("BEGIN")
+        try:
+            if users:
+                _CONN.executemany("""
+                    INSERT INTO users (user_id, username, first_name)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        username = excluded.username,
+                        first_name = excluded.first_name
+                    WHERE users.username IS NOT excluded.username
+                       OR users.first_name IS NOT excluded.first_name
+                """, users)
+            if calcs:
+                _CONN.executemany("""
+                    INSERT INTO calculations (
+                        user_id, gender, age, weight, height,
+                        activity, goal, bmr, tdee, target_calories
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, calcs)
+            _CONN.execute("COMMIT")
+        except Exception:
+            _CONN.execute("ROLLBACK")
+            raise
+
+
+async def _writer():
+    """Drain the write queue, committing up to WRITE_BATCH_SIZE rows at once."""
+    stopping = False
+    while not stopping:
+        item = await _write_queue.get()
+        if item is None:
+            break
+
+        batch = [item]
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                item = _write_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+
+        try:
+            await asyncio.to_thread(_write_batch, batch)
+        except Exception:
+            logger.exception("Failed to write %d queued rows", len(batch))
+
+
+def start_writer() -> asyncio.Task:
+    """Start the background writer task. Call after init_db()."""
+    global _writer_task
+    _writer_task = asyncio.create_task(_writer())
+    return _writer_task
+
+
+async def stop_writer():
+    """Flush pending writes and stop the background writer task."""
+    global _writer_task
+    if _writer_task is None:
+        return
+    await _write_queue.put(None)
+    await _writer_task
+    _writer_task = None
+
+
+async def add_or_update_user(user_id: int, username: Optional[str], first_name: Optional[str]):
     """Add new user or update existing one."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO users (user_id, username, first_name)
-        VALUES (?, ?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET
-            username = excluded.username,
-            first_name = excluded.first_name
-    """, (user_id, username, first_name))
-    
-    conn.commit()
-    conn.close()
-
-
-def save_calculation(user_id: int, data: Dict):
+    await _write_queue.put(("user", (user_id, username, first_name)))
+
+
+async def save_calculation(user_id: int, data: Dict):
     """Save a calculation to database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO calculations (
-            user_id, gender, age, weight, height, 
-            activity, goal, bmr, tdee, target_calories
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+    await _write_queue.put(("calc", (
         user_id,
         data['gender'],
         data['age'],
@@ -85,53 +212,44 @@ def save_calculation(user_id: int, data: Dict):
         data['bmr'],
         data['tdee'],
         data['target_calories']
-    ))
-    
-    conn.commit()
-    conn.close()
+    )))
 
 
 def get_user_stats() -> Dict:
     """Get overall statistics about users and calculations."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM users")
-    total_users = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM calculations")
-    total_calculations = cursor.fetchone()[0]
-    
-    cursor.execute("""
-        SELECT AVG(age), AVG(weight), AVG(height) 
-        FROM calculations
-    """)
-    avg_data = cursor.fetchone()
-    
-    cursor.execute("""
-        SELECT goal, COUNT(*) as count
-        FROM calculations
-        GROUP BY goal
-        ORDER BY count DESC
-    """)
-    goals = cursor.fetchall()
-    
-    cursor.execute("""
-        SELECT activity, COUNT(*) as count
-        FROM calculations
-        GROUP BY activity
-        ORDER BY count DESC
-    """)
-    activities = cursor.fetchall()
-    
-    conn.close()
-    
+    with _RO_LOCK:
+        row = _RO_CONN.execute("""
+            WITH goal_counts AS (
+                SELECT goal, COUNT(*) AS n
+                FROM calculations
+                GROUP BY goal
+                ORDER BY n DESC
+            ),
+            activity_counts AS (
+                SELECT activity, COUNT(*) AS n
+                FROM calculations
+                GROUP BY activity
+                ORDER BY n DESC
+            )
+            SELECT
+                (SELECT COUNT(*) FROM users),
+                COUNT(*), AVG(age), AVG(weight), AVG(height),
+                (SELECT json_group_array(json_array(goal, n)) FROM goal_counts),
+                (SELECT json_group_array(json_array(activity, n)) FROM activity_counts)
+            FROM calculations
+        """).fetchone()
+
+    (total_users, total_calculations, avg_age, avg_weight, avg_height,
+     goals_json, activities_json) = row
+    goals = [tuple(pair) for pair in json.loads(goals_json)]
+    activities = [tuple(pair) for pair in json.loads(activities_json)]
+
     return {
         'total_users': total_users,
         'total_calculations': total_calculations,
-        'avg_age': round(avg_data[0], 1) if avg_data[0] else 0,
-        'avg_weight': round(avg_data[1], 1) if avg_data[1] else 0,
-        'avg_height': round(avg_data[2], 1) if avg_data[2] else 0,
+        'avg_age': round(avg_age, 1) if avg_age else 0,
+        'avg_weight': round(avg_weight, 1) if avg_weight else 0,
+        'avg_height': round(avg_height, 1) if avg_height else 0,
         'top_goals': goals,
         'top_activities': activities
     }
@@ -139,21 +257,16 @@ def get_user_stats() -> Dict:
 
 def get_user_history(user_id: int, limit: int = 5) -> List[Dict]:
     """Get calculation history for a specific user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT age, weight, height, activity, goal, 
-               target_calories, created_at
-        FROM calculations
-        WHERE user_id = ?
-        ORDER BY created_at DESC
-        LIMIT ?
-    """, (user_id, limit))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
+    with _RO_LOCK:
+        rows = _RO_CONN.execute("""
+            SELECT age, weight, height, activity, goal,
+                   target_calories, created_at
+            FROM calculations
+            WHERE user_id = ?
+            ORDER BY created_at DESC
+            LIMIT ?
+        """, (user_id, limit)).fetchall()
+
     history = []
     for row in rows:
         history.append({
@@ -165,5 +278,5 @@ def get_user_history(user_id: int, limit: int = 5) -> List[Dict]:
             'target_calories': row[5],
             'created_at': row[6]
         })
-    
-    return history
\ No newline at end of file
+
+    return history
@@ -0,0 +1,131 @@
+"""
+Redis-backed persistence for FitCalc bot
+Keeps in-progress conversations across restarts of a single bot process
+"""
+
+import json
+from dataclasses import asdict
+from typing import Any, Dict, Optional, Tuple
+
+import redis.asyncio as redis
+from telegram.ext import BasePersistence, PersistenceInput
+
+STATE_TTL = 3600  # abandoned flows expire after an hour
+
+
+class RedisPersistence(BasePersistence):
+    """Stores each user's conversation state and step under fitcalc:* keys.
+
+    Only user_data["state"] (a dataclass of type ``state_type``) and the
+    ConversationHandler states are persisted; chat, bot and callback data
+    are not used by the bot. PTB loads conversation states only once at
+    startup, so this supports one bot process, not several workers.
+    """
+
+    def __init__(self, url: str, state_type: type, prefix: str = "fitcalc",
+                 ttl: int = STATE_TTL, update_interval: float = 5):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval
+        )
+        self._redis = redis.from_url(url)
+        self._state_type = state_type
+        self._prefix = prefix
+        self._ttl = ttl
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self._prefix}:user:{user_id}:state"
+
+    def _conv_key(self, name: str, key: Tuple[int, ...]) -> str:
+        return f"{self._prefix}:conv:{name}:{':'.join(map(str, key))}"
+
+    def _decode_state(self, raw: Optional[bytes]) -> Optional[Any]:
+        if raw is None:
+            return None
+        return self._state_type(**json.loads(raw))
+
+    # --- user data ---
+
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        keys = [key async for key in self._redis.scan_iter(match=self._user_key("*"))]
+        if not keys:
+            return {}
+        user_data = {}
+        for key, raw in zip(keys, await self._redis.mget(keys)):
+            state = self._decode_state(raw)
+            if state is not None:
+                user_id = int(key.decode().split(":")[-2])
+                user_data[user_id] = {"state": state}
+        return user_data
+
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        state = data.get("state")
+        if state is None:
+            await self._redis.delete(self._user_key(user_id))
+            return
+        await self._redis.set(
+            self._user_key(user_id), json.dumps(asdict(state)), ex=self._ttl
+        )
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        # In-memory state is always at least as new as Redis, which is only
+        # written every update_interval; reloading it would drop recent answers.
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._redis.delete(self._user_key(user_id))
+
+    # --- conversations ---
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[int, ...], object]:
+        keys = [key async for key in self._redis.scan_iter(match=f"{self._prefix}:conv:{name}:*")]
+        if not keys:
+            return {}
+        conversations = {}
+        for key, raw in zip(keys, await self._redis.mget(keys)):
+            if raw is None:
+                continue
+            conv_key = key.decode()[len(f"{self._prefix}:conv:{name}:"):]
+            conversations[tuple(int(part) for part in conv_key.split(":"))] = json.loads(raw)
+        return conversations
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...],
+                                  new_state: Optional[object]) -> None:
+        if new_state is None:
+            await self._redis.delete(self._conv_key(name, key))
+            return
+        await self._redis.set(self._conv_key(name, key), json.dumps(new_state), ex=self._ttl)
+
+    # --- unused stores ---
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def get_bot_data(self) -> Dict[str, Any]:
+        return {}
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def flush(self) -> None:
+        await self._redis.aclose()